@@ -1,7 +1,17 @@
 # app.py
+import atexit
+import io
+import logging
 import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, request
+from twilio.rest import Client as TwilioClient
 from twilio.twiml.messaging_response import MessagingResponse
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
@@ -11,17 +21,35 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 
+# Reuse one session (with pooled keep-alive connections) for Twilio media
+# downloads instead of paying a TCP+TLS handshake per request.
+_twilio_session = requests.Session()
+_twilio_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])
+))
+
 # Google Sheets Setup
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
 creds = ServiceAccountCredentials.from_json_keyfile_name("credentials.json", scope)
 client = gspread.authorize(creds)
 sheet = client.open("ResumeData").sheet1  # Change to your sheet name
 
+# Sentinel written after the first successful header check so later
+# process starts (e.g. extra Gunicorn workers) skip the Sheets API calls.
+_HEADERS_OK_FLAG = ".headers_ok"
+
 # Add column headers if sheet is empty
 def ensure_headers():
     """Add column headers if the sheet is empty."""
+    if os.path.exists(_HEADERS_OK_FLAG):
+        return
     try:
         if sheet.row_count < 2:  # Only header or empty
             # Check if first row has headers
@@ -34,173 +62,275 @@ def ensure_headers():
                     "CGPA",
                     "BTech College Name"
                 ])
-                print("[INFO] Added column headers to Google Sheet")
+                logger.info("Added column headers to Google Sheet")
+        open(_HEADERS_OK_FLAG, "w").close()
     except Exception as e:
-        print(f"[HEADER ERROR] {e}")
+        logger.error("[HEADER ERROR] %s", e)
 
 # Ensure headers exist
 ensure_headers()
 
+# Buffer rows and flush in batches so each resume doesn't cost a Sheets
+# API round-trip (and we stay under the per-user write quota).
+_pending_rows = []
+_pending_lock = threading.Lock()
+_FLUSH_INTERVAL_SECONDS = 2.0
+
+# Timer threads don't survive fork(), so with preload_app the loop must
+# start inside each worker process, not in the Gunicorn master at import.
+_flush_loop_lock = threading.Lock()
+_flush_loop_started = False
+
+def _ensure_flush_loop():
+    """Start this process's flush loop on first use."""
+    global _flush_loop_started
+    with _flush_loop_lock:
+        if not _flush_loop_started:
+            _flush_loop_started = True
+            _schedule_flush()
+
+def queue_sheet_row(row):
+    """Queue a row for the next batched write to the sheet."""
+    _ensure_flush_loop()
+    with _pending_lock:
+        _pending_rows.append(row)
+
+# Give up on a batch after this many failed flushes so a permanently
+# rejected batch can't be retried every 2 seconds forever.
+_MAX_FLUSH_ATTEMPTS = 5
+_flush_attempts = 0
+
+def flush_sheet_rows():
+    """Write all queued rows to the sheet in a single append_rows call."""
+    global _flush_attempts
+    with _pending_lock:
+        rows, _pending_rows[:] = _pending_rows[:], []
+    if not rows:
+        return
+    try:
+        sheet.append_rows(rows, value_input_option="RAW")
+        logger.debug("[SHEET] Flushed %d row(s)", len(rows))
+        _flush_attempts = 0
+    except Exception as e:
+        _flush_attempts += 1
+        # 4xx other than 429 (malformed rows, revoked credentials) won't
+        # heal on retry; only re-queue for rate limits and transient errors
+        status = getattr(getattr(e, "response", None), "status_code", None)
+        permanent = status is not None and 400 <= status < 500 and status != 429
+        if permanent or _flush_attempts >= _MAX_FLUSH_ATTEMPTS:
+            logger.error("[SHEET ERROR] Dropping %d row(s) after %d attempt(s): %s",
+                         len(rows), _flush_attempts, e)
+            _flush_attempts = 0
+        else:
+            logger.error("[SHEET ERROR] %s (attempt %d, will retry)", e, _flush_attempts)
+            with _pending_lock:
+                _pending_rows[:0] = rows
+
+def _flush_loop():
+    flush_sheet_rows()
+    _schedule_flush()
+
+def _schedule_flush():
+    timer = threading.Timer(_FLUSH_INTERVAL_SECONDS, _flush_loop)
+    timer.daemon = True
+    timer.start()
+
+atexit.register(flush_sheet_rows)
+
+# Single-pass, case-insensitive scan for resume-ish keywords; replaces
+# eight substring passes over a lowercased copy of the message body.
+_RESUME_KEYWORDS_RE = re.compile(
+    r'email|@|mobile|phone|cgpa|college|b\.tech|education', re.IGNORECASE)
+
+# Map MIME types to the extensions we handle; unknown types fall back to
+# the MIME subtype.
+_EXT_MAP = {
+    "application/pdf": "pdf",
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+}
+
+# Heavy work (download, OCR, Gemini) runs here so the webhook can return
+# TwiML to Twilio immediately instead of holding the callback open.
+_executor = ThreadPoolExecutor(max_workers=8)
+_twilio_client = None
+
+def _send_followup(to_number, from_number, body):
+    """Deliver the processing result as a separate WhatsApp message."""
+    global _twilio_client
+    account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+    auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+    if not (account_sid and auth_token and to_number and from_number):
+        logger.warning("[TWILIO] Cannot send follow-up message (missing credentials or numbers)")
+        logger.warning("[TWILIO] Result was: %s", body[:200])
+        return
+    try:
+        if _twilio_client is None:
+            _twilio_client = TwilioClient(account_sid, auth_token)
+        _twilio_client.messages.create(from_=from_number, to=to_number, body=body)
+    except Exception as e:
+        logger.error("[TWILIO ERROR] %s", e)
+
+def _record_and_report(data, to_number, from_number):
+    """Queue the extracted fields for the sheet and message the sender."""
+    logger.debug("Extracted data: %s", data)
+    queue_sheet_row([
+        data.get("Full Name", "N/A"),
+        data.get("Email", "N/A"),
+        data.get("Phone Number", "N/A"),
+        data.get("CGPA", "N/A"),
+        data.get("BTech College Name", "N/A")
+    ])
+    _send_followup(to_number, from_number, f"✅ Resume processed successfully!\n\nExtracted info:\n{data}")
+
 @app.route("/", methods=["GET"])
 def health_check():
     """Health check endpoint."""
     return "✅ WhatsApp Resume Parser is running! Send a resume via WhatsApp."
 
+def _run_resume_task(task, args, to_number, from_number):
+    """Executor entry point: any escape from the task (e.g. a download
+    ConnectionError) is logged and reported to the sender rather than
+    dying silently inside a never-read Future."""
+    try:
+        task(*args, to_number, from_number)
+    except Exception as e:
+        logger.exception("Background resume processing failed")
+        _send_followup(to_number, from_number, f"❌ Error processing resume: {str(e)}")
+
+def _process_media_resume(media_url, content_type, form_account_sid, to_number, from_number):
+    """Download, extract, and parse a resume file; runs on the executor."""
+    content_type = content_type.lower()
+    file_extension = _EXT_MAP.get(content_type, content_type.split("/")[-1])
+
+    logger.debug("Downloading media (content type %s, extension %s) from %s",
+                 content_type, file_extension, media_url)
+
+    # Download the media file with Twilio authentication
+    # Twilio media URLs require Basic Auth with Account SID and Auth Token
+    account_sid = os.getenv("TWILIO_ACCOUNT_SID") or form_account_sid
+    auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+
+    if account_sid and auth_token:
+        logger.debug("Using Twilio authentication (SID %s...)", account_sid[:10])
+        auth = (account_sid, auth_token)
+    else:
+        logger.warning("No Twilio credentials; trying media download without auth")
+        auth = None
+
+    # Stream the body into an in-memory buffer in 64KB chunks; the file is
+    # processed once and never needs to touch the downloads/ directory.
+    buf = io.BytesIO()
+    with _twilio_session.get(media_url, auth=auth, stream=True, timeout=(3.05, 30)) as r:
+        logger.debug("Download response status: %d", r.status_code)
+
+        if r.status_code != 200:
+            logger.error("Failed to download media. Status: %d, response: %s",
+                         r.status_code, r.text[:200])
+            _send_followup(to_number, from_number,
+                           f"❌ Error downloading resume: HTTP {r.status_code}. Check Twilio credentials.")
+            return
+
+        # r.raw bypasses urllib3's transparent decoding; without this a
+        # Content-Encoding-compressed response would buffer as gzip bytes
+        r.raw.decode_content = True
+        shutil.copyfileobj(r.raw, buf, length=64 * 1024)
+
+    logger.debug("File downloaded. Size: %d bytes", buf.getbuffer().nbytes)
+
+    # Extract text based on file type
+    text = ""
+    try:
+        if file_extension.lower() == "pdf":
+            logger.debug("Attempting PDF extraction...")
+            buf.seek(0)
+            text = extract_text_from_pdf(buf)
+            logger.debug("PDF extracted text length: %d characters", len(text))
+
+            # If PDF extraction returns little or no text, it might be a scanned/image PDF
+            # Try OCR as fallback
+            if len(text.strip()) < 50:  # Very little text extracted
+                logger.debug("PDF returned minimal text, trying OCR as fallback...")
+                try:
+                    ocr_text = extract_text_from_image(buf)
+                    if len(ocr_text.strip()) > len(text.strip()):
+                        logger.debug("OCR found more text (%d chars), using OCR result", len(ocr_text))
+                        text = ocr_text
+                    else:
+                        logger.debug("OCR didn't help, keeping PDF extraction (%d chars)", len(text))
+                except Exception as ocr_error:
+                    logger.debug("OCR fallback failed: %s, using PDF result", ocr_error)
+            else:
+                logger.debug("PDF extraction successful")
+        else:
+            logger.debug("Attempting image/OCR extraction...")
+            text = extract_text_from_image(buf)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Final extracted text length: %d characters", len(text))
+            logger.debug("First 500 chars of text: %s", text[:500])
+
+        if not text or len(text.strip()) == 0:
+            logger.error("No text could be extracted from the file!")
+            _send_followup(to_number, from_number,
+                           "❌ Could not extract text from the resume. Please ensure the file is not corrupted.")
+            return
+    except Exception as e:
+        logger.exception("Extraction failed for media from %s", media_url)
+        _send_followup(to_number, from_number, f"❌ Error processing resume: {str(e)}")
+        return
+
+    data = extract_resume_info(text)
+    _record_and_report(data, to_number, from_number)
+
+def _process_text_resume(body, to_number, from_number):
+    """Parse a resume pasted as plain text; runs on the executor."""
+    data = extract_resume_info(body)
+    _record_and_report(data, to_number, from_number)
+
 @app.route("/whatsapp", methods=["GET", "POST"])
 def whatsapp_webhook():
-    """Webhook to handle incoming WhatsApp messages via Twilio."""
-    print("twilio webhook triggered")
+    """Webhook to handle incoming WhatsApp messages via Twilio.
+
+    Heavy processing is submitted to a background executor so Twilio gets
+    its TwiML response right away; results arrive as a follow-up message.
+    """
+    logger.debug("twilio webhook triggered")
     if request.method == "GET":
         # Webhook verification for Twilio
         return "Webhook verified"
-    
-    msg = request.form.get("Body", "").lower()
+
     num_media = int(request.form.get("NumMedia", 0))
     resp = MessagingResponse()
 
+    # Who to message back: the sender, from our WhatsApp number
+    sender = request.form.get("From")
+    receiver = request.form.get("To")
+
     if num_media > 0:
-        import time
-        
         media_url = request.form.get("MediaUrl0")
         content_type = request.form.get("MediaContentType0", "")
-        
-        # Create unique filename with timestamp to avoid overwriting
-        timestamp = int(time.time())
-        file_extension = content_type.split("/")[-1]
-        
-        # Handle PDF and common image formats
-        if "pdf" in content_type.lower():
-            file_extension = "pdf"
-        elif "png" in content_type.lower():
-            file_extension = "png"
-        elif "jpeg" in content_type.lower() or "jpg" in content_type.lower():
-            file_extension = "jpg"
-            
-        file_name = f"resume_{timestamp}.{file_extension}"
-        file_path = os.path.join("downloads", file_name)
-        os.makedirs("downloads", exist_ok=True)
-
-        print(f"[DEBUG] Downloading file: {file_name}")
-        print(f"[DEBUG] Content type: {content_type}")
-        print(f"[DEBUG] Detected extension: {file_extension}")
-        print(f"[DEBUG] Media URL: {media_url}")
-        
-        # Download the media file with Twilio authentication
-        # Twilio media URLs require Basic Auth with Account SID and Auth Token
-        account_sid = os.getenv("TWILIO_ACCOUNT_SID") or request.form.get("AccountSid")
-        auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-        
-        print(f"[DEBUG] Account SID: {account_sid[:10]}..." if account_sid else "[DEBUG] No Account SID")
-        print(f"[DEBUG] Auth Token available: {'Yes' if auth_token else 'No'}")
-        
-        if account_sid and auth_token:
-            print("[DEBUG] Using Twilio authentication...")
-            auth = (account_sid, auth_token)
-            r = requests.get(media_url, auth=auth)
-        else:
-            print("[DEBUG] WARNING: No Twilio credentials. Media download may fail.")
-            print("[DEBUG] Trying without auth...")
-            r = requests.get(media_url)
-        
-        print(f"[DEBUG] Download response status: {r.status_code}")
-        
-        if r.status_code != 200:
-            print(f"[ERROR] Failed to download media. Status: {r.status_code}")
-            print(f"[ERROR] Response: {r.text[:200]}")
-            resp.message(f"❌ Error downloading resume: HTTP {r.status_code}. Check Twilio credentials.")
-            return str(resp)
-            
-        with open(file_path, "wb") as f:
-            f.write(r.content)
-
-        print(f"[DEBUG] File saved. Size: {os.path.getsize(file_path)} bytes")
-        
-        # Extract text based on file type
-        text = ""
-        try:
-            if file_extension.lower() == "pdf" or file_name.lower().endswith(".pdf"):
-                print("[DEBUG] Attempting PDF extraction...")
-                text = extract_text_from_pdf(file_path)
-                print(f"[DEBUG] PDF extracted text length: {len(text)} characters")
-                
-                # If PDF extraction returns little or no text, it might be a scanned/image PDF
-                # Try OCR as fallback
-                if len(text.strip()) < 50:  # Very little text extracted
-                    print("[DEBUG] PDF returned minimal text, trying OCR as fallback...")
-                    try:
-                        ocr_text = extract_text_from_image(file_path)
-                        if len(ocr_text.strip()) > len(text.strip()):
-                            print(f"[DEBUG] OCR found more text ({len(ocr_text)} chars), using OCR result")
-                            text = ocr_text
-                        else:
-                            print(f"[DEBUG] OCR didn't help, keeping PDF extraction ({len(text)} chars)")
-                    except Exception as ocr_error:
-                        print(f"[DEBUG] OCR fallback failed: {ocr_error}, using PDF result")
-                else:
-                    print(f"[DEBUG] PDF extraction successful")
-            else:
-                print("[DEBUG] Attempting image/OCR extraction...")
-                text = extract_text_from_image(file_path)
-            
-            print(f"[DEBUG] Final extracted text length: {len(text)} characters")
-            print(f"[DEBUG] First 500 chars of text: {text[:500]}")
-            
-            if not text or len(text.strip()) == 0:
-                print("[ERROR] No text could be extracted from the file!")
-                resp.message("❌ Could not extract text from the resume. Please ensure the file is not corrupted.")
-                return str(resp)
-        except Exception as e:
-            print(f"[ERROR] Extraction failed: {e}")
-            import traceback
-            traceback.print_exc()
-            resp.message(f"❌ Error processing resume: {str(e)}")
-            return str(resp)
-        
-        data = extract_resume_info(text)
-        print(f"[DEBUG] Extracted data: {data}")
-
-        # Add to Google Sheets
-        try:
-            sheet.append_row([
-                data.get("Full Name", "N/A"),
-                data.get("Email", "N/A"),
-                data.get("Phone Number", "N/A"),
-                data.get("CGPA", "N/A"),
-                data.get("BTech College Name", "N/A")
-            ])
-        except Exception as e:
-            print(f"[SHEET ERROR] {e}")
-
-        resp.message(f"✅ Resume processed successfully!\n\nExtracted info:\n{data}")
+        form_account_sid = request.form.get("AccountSid")
+
+        _executor.submit(_run_resume_task, _process_media_resume,
+                         (media_url, content_type, form_account_sid), sender, receiver)
+        resp.message("⏳ Resume received! Processing, you'll get the extracted info shortly...")
     else:
         # Handle text-only messages
         body = request.form.get("Body", "")
-        
+
         if body and len(body.strip()) > 10:
-            print(f"[DEBUG] Received text message: {len(body)} characters")
-            print(f"[DEBUG] First 200 chars: {body[:200]}")
-            
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Received text message: %d characters", len(body))
+                logger.debug("First 200 chars: %s", body[:200])
+
             # Check if it looks like a resume text
-            if any(keyword in body.lower() for keyword in ['email', '@', 'mobile', 'phone', 'cgpa', 'college', 'b.tech', 'education']):
-                print("[DEBUG] Looks like a resume text, processing...")
-                
-                # Extract info from plain text using Gemini
-                data = extract_resume_info(body)
-                print(f"[DEBUG] Extracted data: {data}")
-                
-                # Add to Google Sheets
-                try:
-                    sheet.append_row([
-                        data.get("Full Name", "N/A"),
-                        data.get("Email", "N/A"),
-                        data.get("Phone Number", "N/A"),
-                        data.get("CGPA", "N/A"),
-                        data.get("BTech College Name", "N/A")
-                    ])
-                except Exception as e:
-                    print(f"[SHEET ERROR] {e}")
-                
-                resp.message(f"✅ Resume processed successfully!\n\nExtracted info:\n{data}")
+            if _RESUME_KEYWORDS_RE.search(body):
+                logger.debug("Looks like a resume text, processing...")
+                _executor.submit(_run_resume_task, _process_text_resume,
+                                 (body,), sender, receiver)
+                resp.message("⏳ Resume received! Processing, you'll get the extracted info shortly...")
             else:
                 resp.message("📄 Please send a resume text or PDF/image. The message should contain: name, email, phone, CGPA, and college name.")
         else:
@@ -209,4 +339,6 @@ def whatsapp_webhook():
     return str(resp)
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    logger.warning("Starting the single-threaded Flask dev server; "
+                   "use 'gunicorn -c gunicorn.conf.py app:app' in production")
+    app.run()
\ No newline at end of file
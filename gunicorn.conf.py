@@ -0,0 +1,13 @@
+# gunicorn.conf.py
+import os
+
+# Keep Tesseract's OpenMP single-threaded; concurrency comes from workers
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+bind = "0.0.0.0:" + os.getenv("PORT", "5000")
+workers = os.cpu_count()
+threads = 2
+worker_class = "gthread"
+# Import the app (and run ensure_headers) once before forking workers
+preload_app = True
@@ -1,92 +1,294 @@
 # resume_parser.py
+import logging
+import multiprocessing
 import os
 import json
 import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Keep Tesseract's OpenMP from oversubscribing cores; must be set before
+# the library is loaded.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+import cv2
+import numpy as np
 import pdfplumber
-import pytesseract
+from tesserocr import OEM, PSM, PyTessBaseAPI
 from PIL import Image
 import google.generativeai as genai
 
+# pdf2image is optional; without it we just skip the scanned-PDF OCR path
+try:
+    from pdf2image import convert_from_path
+except ImportError:
+    convert_from_path = None
+
+logger = logging.getLogger(__name__)
+
 # Set up Gemini API key
 
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+# Build the model handle once; constructing it per request is wasted work
+_GEMINI_MODEL = genai.GenerativeModel("models/gemini-flash-latest")
+
+# Precompiled, linear-scan patterns for debug field detection. The old
+# phone pattern ('\b\d{10,}\b|[\d\s\-\(\)]{10,}') matched runs of
+# whitespace and scanned quadratically on long OCR output.
+_EMAIL_RE = re.compile(r'[\w.+-]+@[\w.-]+\.[A-Za-z]{2,}')
+_PHONE_RE = re.compile(r'\+?\d[\d\s\-]{8,}\d')
+
+# The fields we extract from every resume, in sheet-column order
+RESUME_FIELDS = ["Full Name", "Email", "Phone Number", "CGPA", "BTech College Name"]
+
+# Ask Gemini for structured output so responses are valid JSON up front
+# instead of free-form text needing regex recovery.
+_GEMINI_JSON_CONFIG = genai.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema={
+        "type": "object",
+        "properties": {field: {"type": "string"} for field in RESUME_FIELDS},
+        "required": RESUME_FIELDS,
+    },
+)
+
+# Patterns for the local (no-Gemini) fast path
+_CGPA_RE = re.compile(r'CGPA\s*[:\-]?\s*(\d{1,2}(?:\.\d{1,2})?)', re.IGNORECASE)
+_PHONE_LABEL_RE = re.compile(r'(?:phone|mobile|contact)[^\d+]{0,10}(\+?\d[\d\s\-]{8,}\d)',
+                             re.IGNORECASE)
+# A line mentioning B.Tech alone is usually the degree, not the college;
+# require an actual institution word.
+_COLLEGE_LINE_RE = re.compile(r'^.*(?:Institute|University|College).*$',
+                              re.IGNORECASE | re.MULTILINE)
+_COLLEGE_LABEL_RE = re.compile(r'(?:B\.?\s?Tech\s+)?(?:College(?:\s+Name)?|Institute)\s*[:\-]\s*(.+)',
+                               re.IGNORECASE)
+_COLLEGE_LABEL_PREFIX_RE = re.compile(r'^.*?(?:College(?:\s+Name)?|Institute)\s*[:\-]\s*',
+                                      re.IGNORECASE)
+_NAME_LABEL_RE = re.compile(r'^\s*(?:Full\s+)?Name\s*[:\-]\s*(.+)$', re.IGNORECASE | re.MULTILINE)
+_NAME_LINE_RE = re.compile(r"^[A-Za-z][A-Za-z.'\-]*(?:\s+[A-Za-z][A-Za-z.'\-]*){0,3}$")
+# Document headings that _NAME_LINE_RE would otherwise accept as a name
+_NAME_STOPWORDS = {"curriculum vitae", "resume", "cv", "biodata", "bio data"}
+
+def _valid_phone(candidate):
+    """A plausible phone number has 10-13 digits once separators are stripped."""
+    return 10 <= len(re.sub(r'\D', '', candidate)) <= 13
+
+# Precompiled patterns for recovering JSON from Gemini responses
+_MD_JSON_RE = re.compile(r'```json\s*')
+_MD_TAIL_RE = re.compile(r'```\s*$')
+_MD_HEAD_RE = re.compile(r'^```\s*')
+_JSON_OBJ_RE = re.compile(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', re.DOTALL)
+_FIELD_RES = {
+    field: re.compile(rf'["\']?{re.escape(field)}["\']?\s*:\s*["\']?([^",\n]+)["\']?', re.IGNORECASE)
+    for field in RESUME_FIELDS
+}
+
+def _set_omp_thread_limit():
+    """Worker initializer: keep Tesseract's OpenMP from oversubscribing cores."""
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+# One long-lived Tesseract API per thread (and per pool worker process),
+# so language models are loaded once instead of on every OCR call.
+_tls = threading.local()
+
+def _ocr_to_string(image):
+    """OCR a PIL image with the thread's persistent Tesseract API."""
+    api = getattr(_tls, "api", None)
+    if api is None:
+        api = _tls.api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY, lang='eng')
+    api.SetImage(image)
+    return api.GetUTF8Text()
+
+# Tesseract runtime scales with pixel count, and resumes gain no accuracy
+# beyond ~300 DPI, so clamp the longest image side before OCR.
+_MAX_OCR_DIM = 2500
+
+def _prepare_for_ocr(image):
+    """Grayscale a PIL image and downscale it to at most _MAX_OCR_DIM px."""
+    image = image.convert("L")
+    image.thumbnail((_MAX_OCR_DIM, _MAX_OCR_DIM), Image.LANCZOS)
+    return image
+
+def _binarize_for_ocr(image):
+    """Grayscale + Otsu threshold a PIL image so Tesseract sees clean black-on-white text."""
+    arr = np.array(_prepare_for_ocr(image))
+    arr = cv2.threshold(arr, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+    return Image.fromarray(arr)
+
+def _ocr_page(image):
+    """Binarize and OCR a single page image."""
+    return _ocr_to_string(_binarize_for_ocr(image))
+
+def _ocr_images(images):
+    """OCR a list of page images, one worker process per core, preserving page order."""
+    if len(images) == 1:
+        return [_ocr_page(images[0])]
+    # Spawn rather than fork: this runs inside a multi-threaded worker
+    # holding live grpc/requests state, and forking that is a deadlock
+    # hazard. _ocr_page and its image arguments pickle fine.
+    with ProcessPoolExecutor(max_workers=os.cpu_count(),
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_set_omp_thread_limit) as executor:
+        return list(executor.map(_ocr_page, images))
+
 def pdf_to_images(file_path):
     """Convert PDF pages to images for OCR."""
     images = []
+    if convert_from_path is None:
+        logger.warning("[PDF TO IMAGE] pdf2image not installed, skipping PDF to image conversion")
+        return images
     try:
-        from pdf2image import convert_from_path
-        print(f"[PDF TO IMAGE] Converting PDF to images...")
-        images = convert_from_path(file_path)
-        print(f"[PDF TO IMAGE] Converted {len(images)} pages to images")
-    except ImportError:
-        print("[PDF TO IMAGE] pdf2image not installed, skipping PDF to image conversion")
+        logger.debug("[PDF TO IMAGE] Converting PDF to images...")
+        images = convert_from_path(file_path, dpi=200, thread_count=os.cpu_count())
+        logger.debug("[PDF TO IMAGE] Converted %d pages to images", len(images))
     except Exception as e:
-        print(f"[PDF TO IMAGE ERROR] {e}")
+        logger.error("[PDF TO IMAGE ERROR] %s", e)
     return images
 
-def extract_text_from_pdf(file_path):
-    """Extract text from PDF using pdfplumber."""
+def extract_text_from_pdf(source):
+    """Extract text from a PDF path or file-like object using pdfplumber."""
     text = ""
     try:
-        print(f"[PDF] Opening file: {file_path}")
-        print(f"[PDF] File exists: {os.path.exists(file_path)}")
-        print(f"[PDF] File size: {os.path.getsize(file_path)} bytes")
-        
-        with pdfplumber.open(file_path) as pdf:
-            print(f"[PDF] Total pages: {len(pdf.pages)}")
-            for i, page in enumerate(pdf.pages):
-                page_text = page.extract_text() or ""
-                print(f"[PDF] Page {i+1} text length: {len(page_text)}")
-                text += page_text
-                
-        print(f"[PDF] Total text extracted: {len(text)} characters")
-        
+        logger.debug("[PDF] Opening: %s", source)
+
+        with pdfplumber.open(source) as pdf:
+            logger.debug("[PDF] Total pages: %d", len(pdf.pages))
+
+            # A scanned PDF has no text layer at all; peek at the first
+            # page's chars and skip straight to OCR rather than running a
+            # doomed extract_text pass over every page.
+            if pdf.pages and len(pdf.pages[0].chars) < 5:
+                logger.debug("[PDF] First page has no text layer, treating as scanned PDF")
+            else:
+                empty_streak = 0
+                for i, page in enumerate(pdf.pages):
+                    page_text = page.extract_text() or ""
+                    logger.debug("[PDF] Page %d text length: %d", i + 1, len(page_text))
+                    text += page_text
+                    empty_streak = 0 if page_text.strip() else empty_streak + 1
+                    if empty_streak >= 3:
+                        logger.debug("[PDF] 3 consecutive empty pages, stopping extraction")
+                        break
+
+        logger.debug("[PDF] Total text extracted: %d characters", len(text))
+
         # If PDF extraction returned very little text, it might be a scanned PDF
         if len(text.strip()) < 20:
-            print("[PDF] Very little text extracted, trying OCR on PDF pages...")
-            images = pdf_to_images(file_path)
+            logger.debug("[PDF] Very little text extracted, trying OCR on PDF pages...")
+            if isinstance(source, (str, os.PathLike)):
+                images = pdf_to_images(source)
+            else:
+                # pdf2image needs a real path; spill the buffer lazily
+                source.seek(0)
+                with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+                    tmp.write(source.read())
+                    tmp.flush()
+                    images = pdf_to_images(tmp.name)
             if images:
-                for i, img in enumerate(images):
-                    img_text = pytesseract.image_to_string(img)
-                    print(f"[PDF OCR] Page {i+1} OCR text length: {len(img_text)}")
+                page_texts = _ocr_images(images)
+                for i, img_text in enumerate(page_texts):
+                    logger.debug("[PDF OCR] Page %d OCR text length: %d", i + 1, len(img_text))
                     text += img_text
-                print(f"[PDF OCR] Total OCR text: {len(text)} characters")
-    except Exception as e:
-        print(f"[PDF ERROR] {e}")
-        import traceback
-        traceback.print_exc()
+                logger.debug("[PDF OCR] Total OCR text: %d characters", len(text))
+    except Exception:
+        logger.exception("[PDF ERROR] extraction failed for %s", source)
         text = ""
     return text.strip()
 
-def extract_text_from_image(file_path):
-    """Extract text from an image using pytesseract."""
+def extract_text_from_image(source):
+    """Extract text from an image path or file-like object using Tesseract."""
     try:
-        print(f"[IMAGE] Opening file: {file_path}")
-        print(f"[IMAGE] File exists: {os.path.exists(file_path)}")
-        print(f"[IMAGE] File size: {os.path.getsize(file_path)} bytes")
-        
-        image = Image.open(file_path)
-        print(f"[IMAGE] Image format: {image.format}, Size: {image.size}")
-        
-        # Try OCR with different configurations for better accuracy
-        # First try with default config
-        text = pytesseract.image_to_string(image, lang='eng')
-        
-        # If we got very little text, try with different config
-        if len(text.strip()) < 10:
-            print("[IMAGE] Retrying OCR with additional config...")
-            custom_config = r'--oem 3 --psm 6'  # Assume a single uniform block of text
-            text = pytesseract.image_to_string(image, config=custom_config)
-        
-        print(f"[IMAGE] Text extracted: {len(text)} characters")
-    except Exception as e:
-        print(f"[Image OCR ERROR] {e}")
-        import traceback
-        traceback.print_exc()
+        logger.debug("[IMAGE] Opening: %s", source)
+
+        if isinstance(source, (str, os.PathLike)):
+            img = cv2.imread(source, cv2.IMREAD_GRAYSCALE)
+        else:
+            source.seek(0)
+            img = cv2.imdecode(np.frombuffer(source.read(), np.uint8), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError(f"Could not read image: {source}")
+        logger.debug("[IMAGE] Image size: %dx%d", img.shape[1], img.shape[0])
+
+        # Downscale oversized scans before OCR
+        height, width = img.shape
+        scale = _MAX_OCR_DIM / max(height, width)
+        if scale < 1:
+            img = cv2.resize(img, (int(width * scale), int(height * scale)),
+                             interpolation=cv2.INTER_AREA)
+            logger.debug("[IMAGE] Downscaled to: %dx%d", img.shape[1], img.shape[0])
+
+        # Binarize with Otsu thresholding so a single OCR pass is enough
+        img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+        text = _ocr_to_string(Image.fromarray(img))
+
+        logger.debug("[IMAGE] Text extracted: %d characters", len(text))
+    except Exception:
+        logger.exception("[Image OCR ERROR] extraction failed for %s", source)
         text = ""
     return text.strip()
 
+def _try_local_parse(text):
+    """Deterministic regex extraction; returns a full result dict or None.
+
+    Only returns a result when all 5 fields are confidently found, so the
+    caller can skip the Gemini round-trip for well-structured input.
+    """
+    email = _EMAIL_RE.search(text)
+    cgpa = _CGPA_RE.search(text)
+
+    # Prefer a number next to a Phone/Mobile label; otherwise take the
+    # first candidate that actually validates as a phone number (a bare
+    # _PHONE_RE.search happily matches year ranges like "2019 - 2023").
+    phone = None
+    labeled_phone = _PHONE_LABEL_RE.search(text)
+    if labeled_phone and _valid_phone(labeled_phone.group(1)):
+        phone = labeled_phone.group(1).strip()
+    else:
+        for match in _PHONE_RE.finditer(text):
+            if _valid_phone(match.group(0)):
+                phone = match.group(0).strip()
+                break
+
+    # Prefer an explicitly labelled college; fall back to a line naming
+    # an institution.
+    college_name = None
+    labeled_college = _COLLEGE_LABEL_RE.search(text)
+    if labeled_college:
+        college_name = labeled_college.group(1).strip()
+    else:
+        college_line = _COLLEGE_LINE_RE.search(text)
+        if college_line:
+            college_name = _COLLEGE_LABEL_PREFIX_RE.sub('', college_line.group(0)).strip()
+
+    name = None
+    label = _NAME_LABEL_RE.search(text)
+    if label:
+        name = label.group(1).strip()
+    else:
+        # Fall back to the first non-empty line if it looks like a bare name
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if _NAME_LINE_RE.match(line):
+                name = line
+            break
+    if name and name.lower() in _NAME_STOPWORDS:
+        name = None
+
+    if not (email and phone and cgpa and college_name and name):
+        return None
+
+    return {
+        "Full Name": name,
+        "Email": email.group(0),
+        "Phone Number": phone,
+        "CGPA": cgpa.group(1),
+        "BTech College Name": college_name,
+    }
+
 def extract_json_from_response(response_text):
     """Extract JSON object from AI response text."""
     try:
@@ -100,9 +302,9 @@ def extract_json_from_response(response_text):
                 pass
         
         # Remove markdown code blocks if present
-        cleaned_text = re.sub(r'```json\s*', '', cleaned_text)
-        cleaned_text = re.sub(r'```\s*$', '', cleaned_text)
-        cleaned_text = re.sub(r'^```\s*', '', cleaned_text)
+        cleaned_text = _MD_JSON_RE.sub('', cleaned_text)
+        cleaned_text = _MD_TAIL_RE.sub('', cleaned_text)
+        cleaned_text = _MD_HEAD_RE.sub('', cleaned_text)
         cleaned_text = cleaned_text.strip()
         
         # Try parsing again after removing markdown
@@ -113,8 +315,7 @@ def extract_json_from_response(response_text):
                 pass
         
         # Find the JSON object in the text using a more robust regex
-        json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
-        json_matches = re.findall(json_pattern, cleaned_text, re.DOTALL)
+        json_matches = _JSON_OBJ_RE.findall(cleaned_text)
         
         for match in json_matches:
             try:
@@ -123,99 +324,85 @@ def extract_json_from_response(response_text):
                 continue
         
         # If no JSON found, try to parse as raw text and extract fields manually
-        print(f"[WARNING] Could not parse JSON from response. Trying manual extraction.")
+        logger.warning("Could not parse JSON from response. Trying manual extraction.")
         
         # Extract key-value pairs manually
         result = {}
-        for field in ["Full Name", "Email", "Phone Number", "CGPA", "BTech College Name"]:
-            pattern = rf'["\']?{field}["\']?\s*:\s*["\']?([^",\n]+)["\']?'
-            match = re.search(pattern, cleaned_text, re.IGNORECASE)
+        for field in RESUME_FIELDS:
+            match = _FIELD_RES[field].search(cleaned_text)
             if match:
                 result[field] = match.group(1).strip()
         
         return result if result else None
         
     except Exception as e:
-        print(f"[JSON PARSING ERROR] {e}")
+        logger.error("[JSON PARSING ERROR] %s", e)
         return None
 
+# Resumes rarely exceed this; OCR can produce long junk tails that only
+# inflate Gemini latency and cost.
+_MAX_PROMPT_TEXT_CHARS = 12_000
+
 def extract_resume_info(text):
     """Use Gemini AI to extract structured info from resume text."""
     if not text:
         return {"error": "No text found in resume"}
 
-    prompt = f"""
-    You are a resume parser. Extract ONLY the following information from the resume text and return ONLY a valid JSON object with no additional text or comments. 
-
-    Required JSON structure:
-    {{
-        "Full Name": "student's full name or N/A",
-        "Email": "email address or N/A",
-        "Phone Number": "mobile/phone number or N/A",
-        "CGPA": "CGPA score (e.g., 9.47) or N/A",
-        "BTech College Name": "college/institute name where BTech is being pursued or N/A"
-    }}
-
-    Critical instructions:
-    - Extract ONLY these 5 fields. Do not extract skills, experience, or any other information.
-    - Read the ENTIRE resume text from FIRST character to LAST character - scan every line thoroughly
-    - Search EVERYWHERE in the text - emails and phone numbers could be:
-      * In the header at the top
-      * In a "Basic Information" or "Contact" section  
-      * At the very bottom of the resume in footer
-      * In the middle paragraphs
-      * Near the name or in any section
-      * In any format (with or without labels like "Mobile:", "Email:", "Phone:", etc.)
-    - Look for ANY email pattern (@ symbol) anywhere in the document
-    - Look for ANY phone number pattern (digits, with or without spaces, hyphens, parentheses) anywhere in the document
-    - For CGPA: Search in "Academic Details", "Education", "B.Tech", or anywhere CGPA is mentioned
-    - For College Name: Search in "Academic Details", "Education", B.Tech section, or institution name anywhere
-    - For Name: Usually at the very top, but search throughout if not found
-    - If information is in tabular/structured format, extract it from there too
-    - Be thorough and check ALL parts of the text - nothing should be missed
-    
-    Resume Text:
-    {text}
-
-    Return ONLY the JSON object with no markdown, no explanations, no code blocks. Just pure JSON.
-    """
+    text = text[:_MAX_PROMPT_TEXT_CHARS]
+
+    prompt = f"""Extract exactly these 5 fields from the resume below. Search the entire text, including headers and footers. Return ONLY a valid JSON object — no markdown, no explanations. Use "N/A" for any field not found.
+
+{{
+    "Full Name": "student's full name",
+    "Email": "email address",
+    "Phone Number": "mobile/phone number",
+    "CGPA": "CGPA score (e.g., 9.47)",
+    "BTech College Name": "college/institute where BTech is pursued"
+}}
+
+Resume:
+{text}
+"""
 
     try:
         # Show how much text we're sending to AI
-        print(f"[DEBUG] Total resume text length: {len(text)} characters")
-        
-        # Check if email and phone patterns exist in the text
-        import re
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        phone_pattern = r'\b\d{10,}\b|[\d\s\-\(\)]{10,}'
-        
-        emails_found = re.findall(email_pattern, text)
-        phones_found = re.findall(phone_pattern, text)
-        
-        print(f"[DEBUG] Emails found in text: {emails_found}")
-        print(f"[DEBUG] Phone patterns found in text: {phones_found[:5]}")  # Show first 5
-        
-        # Only show last 500 chars if it's from a file (longer text), otherwise show first 500 for plain text
-        if len(text) > 1000:
-            print(f"[DEBUG] Last 500 chars of resume text: ...{text[-500:]}")
-        else:
-            print(f"[DEBUG] Full text (plain text message): {text[:1000]}")
-        
-        # Use a model that's definitely available (with models/ prefix)
-        model = genai.GenerativeModel("models/gemini-flash-latest")
-        print("[DEBUG] Using model: models/gemini-flash-latest")
-        
-        response = model.generate_content(prompt)
-        print(f"[DEBUG] Response received, length: {len(response.text)}")
-        
-        # Try to extract JSON from the response
-        parsed_data = extract_json_from_response(response.text)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Total resume text length: %d characters", len(text))
+            # Check if email and phone patterns exist in the text
+            logger.debug("Emails found in text: %s", _EMAIL_RE.findall(text))
+            logger.debug("Phone patterns found in text: %s", _PHONE_RE.findall(text)[:5])
+
+        # Try the deterministic fast path before paying for a Gemini call
+        local_data = _try_local_parse(text)
+        if local_data:
+            logger.debug("All 5 fields found locally, skipping Gemini call")
+            return local_data
+
+        if logger.isEnabledFor(logging.DEBUG):
+            # Only show last 500 chars if it's from a file (longer text), otherwise show first 500 for plain text
+            if len(text) > 1000:
+                logger.debug("Last 500 chars of resume text: ...%s", text[-500:])
+            else:
+                logger.debug("Full text (plain text message): %s", text[:1000])
+
+        logger.debug("Using model: models/gemini-flash-latest")
+
+        response = _GEMINI_MODEL.generate_content(prompt, generation_config=_GEMINI_JSON_CONFIG)
+        logger.debug("Response received, length: %d", len(response.text))
+
+        # JSON mode should give us a parseable object directly; keep the
+        # regex recovery path only as a defensive fallback.
+        try:
+            parsed_data = json.loads(response.text)
+        except json.JSONDecodeError:
+            logger.warning("JSON-mode response was not valid JSON, falling back to recovery parsing")
+            parsed_data = extract_json_from_response(response.text)
         
         if parsed_data:
             return parsed_data
         else:
             # Fallback: return the raw response
-            print(f"[PARSE FALLBACK] Response: {response.text[:200]}")
+            logger.warning("[PARSE FALLBACK] Response: %s", response.text[:200])
             return {
                 "Full Name": "N/A",
                 "Email": "N/A",
@@ -225,5 +412,5 @@ def extract_resume_info(text):
                 "raw_response": response.text[:500]
             }
     except Exception as e:
-        print(f"[GEMINI ERROR] {e}")
+        logger.error("[GEMINI ERROR] %s", e)
         return {"error": str(e)}
\ No newline at end of file